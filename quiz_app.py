@@ -1,23 +1,202 @@
+import os
+import random
+import tempfile
+import threading
+import zlib
+
 import streamlit as st
 import pandas as pd
 
-@st.cache_data
+# Chapter CSVs live next to this script, so the app works from any CWD
+APP_DIR = os.path.dirname(os.path.realpath(__file__))
+
+CHAPTER_TITLES = (
+    "Introduction to ESG Investing",
+    "The ESG Market",
+    "Environmental Factors",
+    "Social Factors",
+    "Governance Factors",
+    "Engagement and Stewardship",
+    "ESG Analysis, Valuation, and Integration",
+    "Integrated Portfolio Construction and Management",
+    "Investment Mandates, Portfolio Analytics, and Client Reporting",
+)
+
+# (button label, CSV file) for each chapter in the main menu
+CHAPTERS = tuple(
+    (f"Chapter {i} - {title}", os.path.join(APP_DIR, f"chapter{i}.csv"))
+    for i, title in enumerate(CHAPTER_TITLES, start=1)
+)
+
+# Columns every chapter CSV provides
+QUESTION_COLUMNS = (
+    "question",
+    "optionA",
+    "optionB",
+    "optionC",
+    "correctAnswer",
+    "explanation",
+)
+
+# Answer letters, in the same order as the option columns above
+_LETTERS = ("A", "B", "C")
+
+# Initial session state, before any chapter is chosen
+_DEFAULTS = {
+    "csv_file": None,
+    "answered": False,
+    "current_question": 0,
+    "selected_answer": None,
+    "score": 0,
+}
+
+# Settings for parsing the chapter CSVs. The pickle cache name is tagged
+# with a checksum of these and the pandas version, so pickles written
+# with other settings or by another pandas are never reused.
+# pyarrow ships with streamlit; its native parser beats the default
+# engine's setup cost on these small files.
+_READ_CSV_KWARGS = {"engine": "pyarrow", "dtype_backend": "pyarrow"}
+_PICKLE_TAG = format(
+    zlib.crc32(repr((pd.__version__, sorted(_READ_CSV_KWARGS.items()))).encode()),
+    "08x",
+)
+
+def _read_questions(csv_file):
+    """
+    Read the questions DataFrame for csv_file.
+    A pickled copy is kept next to the CSV and reused until the CSV changes,
+    so the CSV only has to be parsed once. An unreadable pickle is ignored
+    and rewritten from the CSV.
+    """
+    pkl_file = f"{os.path.splitext(csv_file)[0]}.{_PICKLE_TAG}.pkl"
+    if (os.path.exists(pkl_file)
+            and os.path.getmtime(pkl_file) >= os.path.getmtime(csv_file)):
+        try:
+            return pd.read_pickle(pkl_file)
+        except Exception:
+            # Truncated or otherwise corrupt: fall back to the CSV
+            pass
+
+    df = pd.read_csv(csv_file, **_READ_CSV_KWARGS)
+    try:
+        # Write to a temp file and swap it in, so a reader never sees
+        # a partly written pickle
+        fd, tmp_file = tempfile.mkstemp(
+            dir=os.path.dirname(pkl_file) or os.curdir, suffix=".pkl.tmp"
+        )
+        os.close(fd)
+        try:
+            df.to_pickle(tmp_file)
+            os.replace(tmp_file, pkl_file)
+        except BaseException:
+            os.remove(tmp_file)
+            raise
+    except OSError:
+        # Read-only deployment: just keep the parsed CSV
+        pass
+    return df
+
+def _parse_questions(csv_file):
+    """
+    Read csv_file into one list per column (see QUESTION_COLUMNS), so
+    reading a question field is a plain list index with no pandas lookup.
+    correctAnswer is stored as an index into _LETTERS (0, 1 or 2), or None
+    for an unknown letter. Uses no Streamlit calls, so it is safe to run
+    from the preload thread.
+    """
+    df = _read_questions(csv_file)
+    questions = {col: df[col].tolist() for col in QUESTION_COLUMNS}
+    answer_codes = {letter: code for code, letter in enumerate(_LETTERS)}
+    questions["correctAnswer"] = [
+        answer_codes.get(letter) for letter in questions["correctAnswer"]
+    ]
+    return questions
+
+# Shared by reference across reruns and sessions: callers must not mutate
+# the returned lists. Restarts are covered by the on-disk pickle above.
+@st.cache_resource(show_spinner=False)
 def load_questions(csv_file):
-    """Load the questions from the specified CSV file."""
+    """
+    Load the questions from the specified CSV file, as returned by
+    _parse_questions.
+    """
+    preloaded = start_preload()
+    if csv_file in preloaded:
+        return preloaded[csv_file]
     try:
-        df = pd.read_csv(csv_file)
-        return df
+        return _parse_questions(csv_file)
     except pd.errors.ParserError as e:
         st.error(f"Error loading CSV: {e}")
         st.stop()
+        # Never fall through to returning None, which would be cached
+        raise
     except FileNotFoundError:
         st.error("CSV file not found. Please check the file path.")
         st.stop()
+        raise
+
+def _preload_all_chapters(preloaded):
+    """
+    Parse every chapter into preloaded, keyed by CSV path. Failures are
+    skipped and left for the foreground load_questions call to report.
+    """
+    for _, csv_file in CHAPTERS:
+        try:
+            questions = _parse_questions(csv_file)
+        except Exception:
+            continue
+        # The foreground reads this dict while the thread is still
+        # filling it. Each chapter is added in one assignment, only once
+        # it is fully parsed, so readers see a chapter whole or not at all.
+        preloaded[csv_file] = questions
+
+@st.cache_resource
+def start_preload():
+    """
+    Parse all chapters in a background thread, so choosing a chapter
+    doesn't wait on the first load. Returns the dict the thread fills.
+    Cached so the thread is only started once per server process, and so
+    every rerun (each in a fresh __main__ module) gets the same dict.
+    """
+    preloaded = {}
+    thread = threading.Thread(
+        target=_preload_all_chapters, args=(preloaded,), daemon=True
+    )
+    thread.start()
+    return preloaded
+
+def _start_quiz(csv_file):
+    """
+    Button callback: reset the session state for a new quiz on csv_file.
+    Passing None returns to the main menu.
+    """
+    # Normalize the path so every caller hits the same load_questions entry
+    if csv_file is not None:
+        csv_file = os.path.realpath(csv_file)
+    st.session_state.update({**_DEFAULTS, "csv_file": csv_file})
+    # Drop the previous quiz's order so the next one is shuffled fresh
+    st.session_state.pop("order", None)
+
+def _back_to_menu():
+    """Button callback: leave the current quiz and go back to the chapter menu."""
+    _start_quiz(None)
+
+def _back_to_menu_button():
+    """
+    Render the "Back to Main Menu" button. quiz() draws it in exactly one
+    place per run, so it always uses the same widget key.
+    """
+    st.button("Back to Main Menu", key="back_to_menu", on_click=_back_to_menu)
+
+def _next_question():
+    """Button callback: once the current question is answered, move on."""
+    if st.session_state.answered:
+        st.session_state.update(answered=False, selected_answer=None)
 
 def display_score_bar():
     """
-    Renders a horizontal bar showing the fraction of correct answers
-    among the questions answered so far (green = correct, red = incorrect).
+    Renders a progress bar showing the fraction of correct answers
+    among the questions answered so far.
     """
     answered_count = st.session_state.current_question
     correct_count = st.session_state.score
@@ -26,75 +205,44 @@ def display_score_bar():
     if answered_count == 0:
         return
 
-    correct_percentage = (correct_count / answered_count) * 100
-    score_bar_html = f"""
-    <div style="background-color: #ddd; width: 100%; height: 20px; position: relative; margin-top: 10px;">
-        <div style="background-color: green; width: {correct_percentage}%; height: 20px; float: left;"></div>
-        <div style="background-color: red; width: {100 - correct_percentage}%; height: 20px; float: left;"></div>
-    </div>
-    <p style="margin-top: 5px;">
-        Correct: {correct_count} / {answered_count} ({correct_percentage:.1f}%)
-    </p>
-    """
-    st.markdown(score_bar_html, unsafe_allow_html=True)
+    correct_fraction = correct_count / answered_count
+    st.progress(
+        correct_fraction,
+        text=f"Correct: {correct_count} / {answered_count} ({correct_fraction * 100:.1f}%)"
+    )
 
-def quiz():
+@st.fragment
+def _question_fragment(cols):
     """
-    Runs the quiz flow using the CSV file in st.session_state.csv_file,
-    but now with only three answer choices: A, B, C.
+    Shows the current question with its Submit and Next Question buttons.
+    Clicking them reruns only this fragment, not the whole quiz page.
     """
-
-    # Load and shuffle questions once per session
-    if "shuffled_df" not in st.session_state:
-        df = load_questions(st.session_state.csv_file)
-        # Shuffle the DataFrame randomly
-        st.session_state.shuffled_df = df.sample(frac=1).reset_index(drop=True)
-
-    shuffled_df = st.session_state.shuffled_df
+    order = st.session_state.order
     q_idx = st.session_state.current_question
 
-    # If all questions are done, show final result
-    if q_idx >= len(shuffled_df):
-        st.write("Quiz finished! You've gone through all the questions.")
-        display_score_bar()
-
-        # Show a "Back to Main Menu" button
-        if st.button("Back to Main Menu"):
-            st.session_state.csv_file = None
-            st.session_state.current_question = 0
-            st.session_state.answered = False
-            st.session_state.selected_answer = None
-            st.session_state.score = 0
-            st.rerun()
-        return
+    # Past the last question: rerun the full app to show the final result
+    if q_idx >= len(order):
+        st.rerun()
 
     # ============ Display the Current Question ============
 
     # Extract question data
-    question_text = shuffled_df.loc[q_idx, "question"]
-    optionA = shuffled_df.loc[q_idx, "optionA"]
-    optionB = shuffled_df.loc[q_idx, "optionB"]
-    optionC = shuffled_df.loc[q_idx, "optionC"]
-    correct_ans = shuffled_df.loc[q_idx, "correctAnswer"]  # "A", "B", or "C"
-    explanation = shuffled_df.loc[q_idx, "explanation"]
+    idx = order[q_idx]
+    question_text = cols["question"][idx]
+    optionA = cols["optionA"][idx]
+    optionB = cols["optionB"][idx]
+    optionC = cols["optionC"][idx]
+    correct_ans = cols["correctAnswer"][idx]  # 0, 1 or 2 for A, B or C
+    explanation = cols["explanation"][idx]
 
     st.subheader(f"Question {q_idx + 1}")
     st.write(question_text)
 
     # Build labels for radio buttons (three options: A, B, C)
-    labelA = f"A) {optionA}"
-    labelB = f"B) {optionB}"
-    labelC = f"C) {optionC}"
-
-    # We'll store these labels in a list
-    labels = [labelA, labelB, labelC]
-
-    # Map each label to a letter so we know which answer was chosen
-    label_to_letter = {
-        labelA: "A",
-        labelB: "B",
-        labelC: "C",
-    }
+    labels = [
+        f"{letter}) {option}"
+        for letter, option in zip(_LETTERS, (optionA, optionB, optionC))
+    ]
 
     def on_choice_change():
         # If user changes their selection, allow new submission
@@ -107,14 +255,16 @@ def quiz():
         key="radio_answer",
         on_change=on_choice_change
     )
-    # Convert the selected label (e.g. "A) Berlin") back to "A"
-    st.session_state.selected_answer = label_to_letter[selected_label]
+    # Convert the selected label (e.g. "A) Berlin") back to its code (0)
+    st.session_state.selected_answer = labels.index(selected_label)
 
     # ============ Buttons: Submit & Next Question ============
 
     col1, col2 = st.columns(2)
     submit_clicked = col1.button("Submit", disabled=st.session_state.answered)
-    next_clicked = col2.button("Next Question")
+    # current_question was already advanced on Submit, so the callback
+    # only has to clear the answered flag before the next run
+    col2.button("Next Question", on_click=_next_question)
 
     # If Submit clicked: check correctness, show explanation, update score
     if submit_clicked and not st.session_state.answered:
@@ -126,15 +276,9 @@ def quiz():
             st.success("Correct! ✅")
             st.session_state.score += 1
         else:
-            # e.g. correct_ans is "C"
-            # If "C", the correct text is "C) {optionC}"
-            correct_option_text = ""
-            if correct_ans == "A":
-                correct_option_text = labelA
-            elif correct_ans == "B":
-                correct_option_text = labelB
-            elif correct_ans == "C":
-                correct_option_text = labelC
+            # e.g. correct_ans is 2
+            # If 2, the correct text is "C) {optionC}"
+            correct_option_text = labels[correct_ans] if correct_ans is not None else ""
 
             st.error(f"Incorrect! The correct answer is {correct_option_text}")
 
@@ -144,22 +288,37 @@ def quiz():
         # Display updated score bar
         display_score_bar()
 
-    # If Next Question clicked, move on (rerun)
-    if next_clicked and st.session_state.answered:
-        # Reset selected answer
-        st.session_state.selected_answer = None
-        st.rerun()
+def quiz():
+    """
+    Runs the quiz flow using the CSV file in st.session_state.csv_file,
+    but now with only three answer choices: A, B, C.
+    """
+
+    cols = load_questions(st.session_state.csv_file)
+    num_questions = len(cols["question"])
+
+    # Shuffle the question order once per session; only the permutation
+    # is stored, the questions themselves are shared through the cache
+    if "order" not in st.session_state:
+        st.session_state.order = random.sample(range(num_questions), num_questions)
+
+    q_idx = st.session_state.current_question
+
+    # If all questions are done, show final result
+    if q_idx >= num_questions:
+        st.write("Quiz finished! You've gone through all the questions.")
+        display_score_bar()
+
+        # Show a "Back to Main Menu" button
+        _back_to_menu_button()
+        return
+
+    _question_fragment(cols)
 
     # ============ Back to Main Menu at Bottom of Page ============
 
     st.write("---")
-    if st.button("Back to Main Menu"):
-        st.session_state.csv_file = None
-        st.session_state.current_question = 0
-        st.session_state.answered = False
-        st.session_state.selected_answer = None
-        st.session_state.score = 0
-        st.rerun()
+    _back_to_menu_button()
 
 def main():
     st.title("Quiz Menu")
@@ -168,86 +327,8 @@ def main():
     if "csv_file" not in st.session_state or st.session_state.csv_file is None:
         st.write("**Please choose which chapter quiz you want to take:**")
 
-        # -- Chapter 1
-        if st.button("Chapter 1 - Introduction to ESG Investing"):
-            st.session_state.csv_file = "chapter1.csv"
-            st.session_state.current_question = 0
-            st.session_state.answered = False
-            st.session_state.selected_answer = None
-            st.session_state.score = 0
-            st.rerun()
-
-        # -- Chapter 2
-        if st.button("Chapter 2 - The ESG Market"):
-            st.session_state.csv_file = "chapter2.csv"
-            st.session_state.current_question = 0
-            st.session_state.answered = False
-            st.session_state.selected_answer = None
-            st.session_state.score = 0
-            st.rerun()
-
-        # -- Chapter 3
-        if st.button("Chapter 3 - Environmental Factors"):
-            st.session_state.csv_file = "chapter3.csv"
-            st.session_state.current_question = 0
-            st.session_state.answered = False
-            st.session_state.selected_answer = None
-            st.session_state.score = 0
-            st.rerun()
-
-         # -- Chapter 4
-        if st.button("Chapter 4 - Social Factors"):
-            st.session_state.csv_file = "chapter4.csv"
-            st.session_state.current_question = 0
-            st.session_state.answered = False
-            st.session_state.selected_answer = None
-            st.session_state.score = 0
-            st.rerun()
-
-        # -- Chapter 5
-        if st.button("Chapter 5 - Governance Factors"):
-            st.session_state.csv_file = "chapter5.csv"
-            st.session_state.current_question = 0
-            st.session_state.answered = False
-            st.session_state.selected_answer = None
-            st.session_state.score = 0
-            st.rerun()
-
-         # -- Chapter 6
-        if st.button("Chapter 6 - Engagement and Stewardship"):
-            st.session_state.csv_file = "chapter6.csv"
-            st.session_state.current_question = 0
-            st.session_state.answered = False
-            st.session_state.selected_answer = None
-            st.session_state.score = 0
-            st.rerun()
-
-                     # -- Chapter 7
-        if st.button("Chapter 7 - ESG Analysis, Valuation, and Integration"):
-            st.session_state.csv_file = "chapter7.csv"
-            st.session_state.current_question = 0
-            st.session_state.answered = False
-            st.session_state.selected_answer = None
-            st.session_state.score = 0
-            st.rerun()
-
-                     # -- Chapter 8
-        if st.button("Chapter 8 - Integrated Portfolio Construction and Management"):
-            st.session_state.csv_file = "chapter8.csv"
-            st.session_state.current_question = 0
-            st.session_state.answered = False
-            st.session_state.selected_answer = None
-            st.session_state.score = 0
-            st.rerun()
-
-                     # -- Chapter 9
-        if st.button("Chapter 9 - Investment Mandates, Portfolio Analytics, and Client Reporting"):
-            st.session_state.csv_file = "chapter9.csv"
-            st.session_state.current_question = 0
-            st.session_state.answered = False
-            st.session_state.selected_answer = None
-            st.session_state.score = 0
-            st.rerun()
+        for label, csv_file in CHAPTERS:
+            st.button(label, on_click=_start_quiz, args=(csv_file,))
 
         st.stop()  # Stop so we don't run quiz() below
 
@@ -257,17 +338,10 @@ def main():
 
 if __name__ == "__main__":
     # Initialize session variables if not set
-    if "csv_file" not in st.session_state:
-        st.session_state.csv_file = None
-    if "answered" not in st.session_state:
-        st.session_state.answered = False
-    if "current_question" not in st.session_state:
-        st.session_state.current_question = 0
-    if "selected_answer" not in st.session_state:
-        st.session_state.selected_answer = None
-    if "score" not in st.session_state:
-        st.session_state.score = 0
+    for key, value in _DEFAULTS.items():
+        st.session_state.setdefault(key, value)
 
+    start_preload()
     main()
 
 # cd /path/to/your/folder